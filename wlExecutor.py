@@ -1,11 +1,17 @@
-import csv
 import time
-import threading
+import asyncio
 import argparse
+import atexit
+import heapq
+import os
 import sys
-from queue import Queue
+import threading
+from collections import namedtuple
+from queue import Queue, Empty
 import subprocess  # !!! 1. 导入 subprocess
-import shlex       # !!! 2. 导入 shlex
+import tempfile
+import numpy as np
+import pandas as pd
 
 # ... (bcolors 类保持不变) ...
 class bcolors:
@@ -18,20 +24,242 @@ class bcolors:
     ENDC = '\033[0m'
     BOLD = '\033[1m'
 
+# 作业与任务日志的格式模板，颜色前缀在导入时拼接好，输出时只需一次 format
+FMT_UF_TASK_ARRIVE = "  {t:.2f}s |   Job {job_id} (UF) -> Task {task_id} 到达。"
+FMT_UF_TASK_DONE = "  {t:.2f}s |   Job {job_id} (UF) <- Task {task_id} 完成 (耗时 {elapsed:.3f}s)。"
+FMT_UF_START = f"{bcolors.OKBLUE}{{t:.2f}}s | [服务启动] Job {{job_id}} (类型: {{job_type}}, 应用: {{app_type}}) 启动，等待 {{task_count}} 个任务...{bcolors.ENDC}"
+FMT_UF_DONE = f"{bcolors.OKBLUE}{{t:.2f}}s | [服务完成] Job {{job_id}} (UF) 已完成所有 {{task_count}} 个任务。{bcolors.ENDC}"
+FMT_HADOOP_START = f"{bcolors.OKCYAN}{{t:.2f}}s | [Hadoop] Job {{job_id}} (应用: {{app_type}}) 启动...{bcolors.ENDC}"
+FMT_HADOOP_DONE = f"{bcolors.OKGREEN}{{t:.2f}}s | [Hadoop] Job {{job_id}} (应用: {{app_type}}) 完成 (耗时 {{elapsed:.2f}}s)。{bcolors.ENDC}"
+FMT_HADOOP_FAIL = f"{bcolors.FAIL}{{t:.2f}}s | [Hadoop] Job {{job_id}} (应用: {{app_type}}) 失败 (耗时 {{elapsed:.2f}}s)。{bcolors.ENDC}"
+FMT_HADOOP_ERROR = f"{bcolors.FAIL}{{t:.2f}}s | [Hadoop] Job {{job_id}} (应用: {{app_type}}) 失败: {{error}}{bcolors.ENDC}"
+FMT_COMMAND = "           L 执行命令: {command}"
+FMT_ERROR_DETAIL = "           L 错误: {error}"
+FMT_SIM_START = f"{bcolors.OKCYAN}{{t:.2f}}s | [模拟] Job {{job_id}} (类型: {{job_type}}, 应用: {{app_type}}) 启动，处理 {{task_count}} 个任务...{bcolors.ENDC}"
+FMT_SIM_DONE = f"{bcolors.OKCYAN}{{t:.2f}}s | [模拟] Job {{job_id}} (B) 完成 (总耗时 {{elapsed:.2f}}s)。{bcolors.ENDC}"
+FMT_JOB_ERROR = f"{bcolors.FAIL}{{t:.2f}}s | Job {{job_id}} 异常终止: {{error!r}}{bcolors.ENDC}"
+MSG_HADOOP_NOT_FOUND = f"{bcolors.FAIL}错误：Hadoop 命令未找到。请检查您的 PATH 或 HADOOP_EXAMPLES_JAR 路径。{bcolors.ENDC}"
+
+# 日志队列：所有标准输出都交给一个后台线程批量写出，作业本身不争用 stdout 锁
+LOG_QUEUE_SIZE = 65536
+LOG_BATCH_SIZE = 256
+log_q = Queue(maxsize=LOG_QUEUE_SIZE)
+
+def log(msg):
+    """输出一行日志 (放入日志队列，由日志线程写出)。"""
+    log_q.put(msg + '\n')
+
+# --quiet: 不输出每个作业/任务的进度日志，只保留失败信息和汇总
+QUIET = False
+
+def log_event(fmt, **fields):
+    """输出一行作业/任务进度日志；--quiet 时直接返回，连格式化也省掉。"""
+    if QUIET:
+        return
+    log(fmt.format(**fields))
+
+def _log_writer():
+    # 每次最多取出 LOG_BATCH_SIZE 条日志，合并成一次 write
+    while True:
+        batch = [log_q.get()]
+        while len(batch) < LOG_BATCH_SIZE:
+            try:
+                batch.append(log_q.get_nowait())
+            except Empty:
+                break
+        try:
+            sys.stdout.write(''.join(batch))
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # 读端已关闭 (例如 | head -1)：把 stdout 指向 /dev/null，之后的日志直接丢弃
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        except (OSError, ValueError):
+            pass # 写不出去的日志直接丢弃，线程必须继续清空队列
+        finally:
+            for _ in batch:
+                log_q.task_done()
+
+def flush_log():
+    """等待日志队列中的所有日志写出 (日志线程已退出时不再等待)。"""
+    with log_q.all_tasks_done:
+        while log_q.unfinished_tasks and log_writer.is_alive():
+            log_q.all_tasks_done.wait(0.1)
+
+log_writer = threading.Thread(target=_log_writer, name="log-writer", daemon=True)
+log_writer.start()
+# 退出前 (包括 sys.exit) 写出剩余日志
+atexit.register(flush_log)
+
+# !!! 准备工作: 您必须修改以下路径 !!!
+HADOOP_EXAMPLES_JAR = r"\\wsl.localhost\Ubuntu\home\mortis\hadoop-3.4.1\share\hadoop\mapreduce\hadoop-mapreduce-examples-3.4.1.jar"
+
+# 命令模板中的占位符，运行时替换为具体作业的参数
+ARG_NUM_MAPS = "<num_maps>"
+ARG_NUM_ROWS = "<num_rows>"
+ARG_OUTPUT_DIR = "<output_dir>"
+
+# 每个 Hadoop 应用的命令参数列表，在导入时构建一次，运行时只替换占位符
+# 第 4 个参数是 examples 中的程序名，也用于命名输出目录
+#
+# 注意: 作业必须经由 hadoop jar 客户端提交，不能直接调用 YARN ResourceManager 的
+# REST API (POST /ws/v1/cluster/apps)。REST 接口只接受完整的 AM 启动上下文，而
+# MapReduce 作业的 job.xml、输入分片等暂存文件正是由客户端生成的。
+# 要减少 JVM 启动开销，请使用 --hadoop-daemon-jar 复用同一个客户端 JVM。
+APP_CMD_TEMPLATES = {
+    # 用 'task_count' 作为 Map 任务的数量
+    # 最后一个参数是每个 map 的样本数 (固定为 1000)
+    "pi": ["hadoop", "jar", HADOOP_EXAMPLES_JAR, "pi", ARG_NUM_MAPS, "1000"],
+    # 'task_count' 无法直接控制 wordcount。
+    # 您必须提前在 HDFS 上准备好 /inputs/wordcount_data
+    "wordcount": ["hadoop", "jar", HADOOP_EXAMPLES_JAR, "wordcount",
+                  "/inputs/wordcount_data", ARG_OUTPUT_DIR],
+    # 'task_count' 无法直接控制 grep。
+    # 您必须提前在 HDFS 上准备好 /inputs/grep_data，最后一个参数是示例正则表达式
+    "grep": ["hadoop", "jar", HADOOP_EXAMPLES_JAR, "grep",
+             "/inputs/grep_data", ARG_OUTPUT_DIR, "Tracie"],
+    # Terasort 是 I/O 密集型基准测试
+    # 为简单起见，我们只运行 teragen（写密集型），用 task_count 控制数据大小
+    # 如需运行 terasort（假设数据已在 /inputs/terasort_data），可改为：
+    # ["hadoop", "jar", HADOOP_EXAMPLES_JAR, "terasort", "/inputs/terasort_data", ARG_OUTPUT_DIR]
+    "terasort": ["hadoop", "jar", HADOOP_EXAMPLES_JAR, "teragen", ARG_NUM_ROWS, ARG_OUTPUT_DIR],
+}
+
+def build_hadoop_args(app_type, job_id, task_count):
+    """
+    用作业参数填充 app_type 的命令模板；不是 Hadoop 应用时返回 None。
+    """
+    template = APP_CMD_TEMPLATES.get(app_type)
+    if template is None:
+        return None
+    values = {
+        ARG_NUM_MAPS: str(task_count),
+        ARG_NUM_ROWS: str(task_count * 1000), # 假设 task_count 太小，我们将其放大
+        ARG_OUTPUT_DIR: f"/outputs/{template[3]}_{job_id}",
+    }
+    return [values.get(arg, arg) for arg in template]
+
+# 常驻 Hadoop 客户端 stdout 的 asyncio StreamReader limit：单行回复的最大长度，
+# 同时也是流量控制的高水位 (缓冲超过该值时暂停读取)；它并不决定每次 read 的大小
+PIPE_BUFFER_SIZE = 1 << 20
+
+# --pin-cpus 启用时，子进程可以使用的 CPU 集合 (None 表示不绑定)
+WORKER_CPUS = None
+
+# 常驻 Hadoop 客户端（可选），由 --hadoop-daemon-jar 启用
+HADOOP_DAEMON = None
+
+# 常驻 Hadoop 客户端的 stderr 追加写入该文件，作业失败时到这里查看详细信息
+HADOOP_DAEMON_LOG = "hadoop_daemon.log"
+
+class HadoopDaemon:
+    """
+    常驻的 Hadoop 客户端：只启动一次 JVM，之后通过 stdin 提交作业。
+
+    包装程序 (--hadoop-daemon-jar) 需要遵循以下行协议：
+      输入:  "<job_id> <应用> <参数...>"，在同一个 JVM 内运行 examples 中的应用
+      输出:  "<job_id> <返回码>"，作业结束时写出一行；其他格式的输出行会被忽略
+    客户端退出后，尚未提交的作业回退到逐个启动 Hadoop 进程 (run_command)。
+    """
+    def __init__(self, proc, log_file):
+        self.proc = proc
+        self.log_file = log_file
+        self.pending = {}
+        self.closing = False
+        self.reader = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def start(cls, daemon_jar):
+        log_file = open(HADOOP_DAEMON_LOG, 'ab')
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "hadoop", "jar", daemon_jar, HADOOP_EXAMPLES_JAR,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=log_file,
+                limit=PIPE_BUFFER_SIZE)
+        except BaseException:
+            log_file.close()
+            raise
+        pin_worker(proc)
+        return cls(proc, log_file)
+
+    async def _read_replies(self):
+        try:
+            # 读取完成标记，唤醒对应的作业
+            async for line in self.proc.stdout:
+                try:
+                    job_id, returncode = map(int, line.split())
+                except ValueError:
+                    continue # 不是完成标记 (例如包装程序打印的其他信息)
+                future = self.pending.pop(job_id, None)
+                if future is not None and not future.done():
+                    future.set_result(returncode)
+        finally:
+            # 客户端退出 (或读取出错)：所有未完成的作业都视为失败
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError(f"常驻 Hadoop 客户端已退出，详见 {HADOOP_DAEMON_LOG}"))
+            self.pending.clear()
+            if not self.closing:
+                log(f"{bcolors.WARNING}警告: 常驻 Hadoop 客户端已退出 (详见 {HADOOP_DAEMON_LOG})，"
+                    f"之后的作业回退到逐个启动 Hadoop 进程。{bcolors.ENDC}")
+
+    async def _submit(self, job_id, app_args):
+        """提交一个作业并等待它完成，返回作业的返回码；作业未能送达客户端时返回 None。"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending[job_id] = future
+        try:
+            self.proc.stdin.write(f"{job_id} {' '.join(app_args)}\n".encode('utf-8'))
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            self.pending.pop(job_id, None)
+            return None
+        return await future
+
+    async def run(self, job_id, args):
+        """
+        执行一个 Hadoop 命令，语义与 run_command 相同：返回码非零时抛出 CalledProcessError。
+        客户端已退出时改用 run_command 单独启动进程。
+        """
+        returncode = None if self.reader.done() else await self._submit(job_id, args[3:])
+        if returncode is None:
+            await run_command(args)
+        elif returncode:
+            raise subprocess.CalledProcessError(
+                returncode, args, stderr=f"详见常驻 Hadoop 客户端的日志 {HADOOP_DAEMON_LOG}".encode('utf-8'))
+
+    async def close(self):
+        self.closing = True
+        try:
+            self.proc.stdin.close()
+            await self.proc.wait()
+            await self.reader
+        finally:
+            self.log_file.close()
+
+# 按列存储的作业表 (SoA)：每个字段是一个按到达时间排序的 ndarray
+# app_type_ids / job_type_ids 分别是 app_types / job_types 中的下标
+JobTable = namedtuple('JobTable', ['job_ids', 'arrivals', 'app_type_ids', 'task_counts',
+                                   'job_type_ids', 'app_types', 'job_types'])
+
 # ... (load_jobs_and_tasks 和 get_sim_time 保持不变) ...
+def encode_column(column):
+    """
+    把字符串列编码为 (不重复的取值, 每行的下标)；下标使用能容纳所有取值的最小整数类型。
+    """
+    values, ids = np.unique(column.to_numpy(str), return_inverse=True)
+    return values, ids.astype(np.min_scalar_type(max(len(values) - 1, 0)))
+
 def load_jobs_and_tasks(jobs_file, tasks_file):
     """
     加载作业和任务文件。
+    作业表由 pandas 的 C 解析器读取并以 JobTable 返回；
+    每个作业的任务到达时间为 float64 的 ndarray。
     """
-    jobs = []
     try:
-        with open(jobs_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                row['job_id'] = int(row['job_id'])
-                row['arrival_time_sec'] = float(row['arrival_time_sec'])
-                row['task_count'] = int(row['task_count'])
-                jobs.append(row)
+        jobs_df = pd.read_csv(jobs_file, dtype={'job_id': np.int32,
+                                                'arrival_time_sec': np.float64,
+                                                'job_type': str,
+                                                'app_type': str,
+                                                'task_count': np.int32}, engine='c')
     except FileNotFoundError:
         print(f"{bcolors.FAIL}错误: 作业文件未找到 '{jobs_file}'{bcolors.ENDC}", file=sys.stderr)
         sys.exit(1)
@@ -41,231 +269,346 @@ def load_jobs_and_tasks(jobs_file, tasks_file):
         
     tasks_db = {}
     try:
+        # np.fromstring 遇到无法解析的字段只发出 DeprecationWarning 并截断结果，这里把它变成异常
         with open(tasks_file, 'r') as f:
-            reader = csv.reader(f)
-            next(reader) # 跳过表头
-            for row in reader:
-                job_id = int(row[0])
-                # 将任务到达时间戳从字符串转换为浮点数列表
-                task_arrivals = [float(t) for t in row[1:]]
-                tasks_db[job_id] = task_arrivals
+            next(f) # 跳过表头
+            for line_no, line in enumerate(f, start=2):
+                job_id, _, timestamps = line.partition(',')
+                # 各行长度不一，逐行交给 numpy 解析为浮点数组
+                # (不用 np.fromstring：它会把空字段当作 -1.0 或直接截断，而这里空字段会报错)
+                try:
+                    task_arrivals = np.array(timestamps.split(','), dtype=np.float64)
+                except ValueError:
+                    raise ValueError(f"第 {line_no} 行包含无法解析的时间戳") from None
+                tasks_db[int(job_id)] = task_arrivals
     except FileNotFoundError:
         print(f"{bcolors.FAIL}错误: 任务文件未找到 '{tasks_file}'{bcolors.ENDC}", file=sys.stderr)
         sys.exit(1)
+    except ValueError as e:
+        print(f"{bcolors.FAIL}错误: 读取任务文件失败: {e}{bcolors.ENDC}", file=sys.stderr)
+        sys.exit(1)
+        
+    # 每个作业都必须在任务文件中有对应的行
+    missing = sorted(set(jobs_df['job_id'].tolist()) - tasks_db.keys())
+    if missing:
+        print(f"{bcolors.FAIL}错误: 任务文件中缺少 {len(missing)} 个作业的任务 (例如 Job {missing[0]}){bcolors.ENDC}", file=sys.stderr)
+        sys.exit(1)
         
     # 按到达时间对作业进行排序
-    jobs.sort(key=lambda j: j['arrival_time_sec'])
+    arrivals = jobs_df['arrival_time_sec'].to_numpy(np.float64)
+    order = np.argsort(arrivals, kind='stable')
+    
+    # 应用名和作业类型只保存一份，每个作业只记录其下标
+    app_types, app_type_ids = encode_column(jobs_df['app_type'])
+    job_types, job_type_ids = encode_column(jobs_df['job_type'])
+    jobs = JobTable(
+        job_ids=jobs_df['job_id'].to_numpy(np.int32)[order],
+        arrivals=arrivals[order],
+        app_type_ids=app_type_ids[order],
+        task_counts=jobs_df['task_count'].to_numpy(np.int32)[order],
+        job_type_ids=job_type_ids[order],
+        app_types=app_types,
+        job_types=job_types,
+    )
     
     return jobs, tasks_db
 
 def get_sim_time(start_time):
     """返回自工作负载开始以来的模拟时间"""
-    return time.time() - start_time
+    return time.monotonic() - start_time
 
+def pin_cpus():
+    """
+    把调度线程绑定到一个专用 CPU，其余 CPU 留给 Hadoop 子进程。
+    平台不支持或可用 CPU 少于 2 个时返回 False。
+    """
+    global WORKER_CPUS
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    cpus = os.sched_getaffinity(0)
+    if len(cpus) < 2:
+        return False
+    scheduler_cpu = min(cpus)
+    WORKER_CPUS = cpus - {scheduler_cpu}
+    os.sched_setaffinity(0, {scheduler_cpu})
+    return True
 
-# ... (run_uf_task 保持不变, 它用于 UF 作业) ...
-def run_uf_task(job_id, task_id, task_arrival_time, job_start_time, sim_task_duration):
+def pin_worker(proc):
     """
-    在一个单独的线程中模拟一个UF任务（例如一个Web请求）。
+    把刚启动的子进程改绑到工作 CPU (子进程默认继承调度线程的绑定)。
+    在启动之后由父进程设置，而不是用 preexec_fn：后者在有日志线程运行时 fork 并不安全，
+    而且会让 subprocess 放弃更快的 posix_spawn/vfork 路径。
     """
-    # 1. 等待任务的相对到达时间
-    now = time.time()
-    job_elapsed = now - job_start_time
-    wait_time = task_arrival_time - job_elapsed
+    if not WORKER_CPUS:
+        return
+    try:
+        os.sched_setaffinity(proc.pid, WORKER_CPUS)
+    except OSError:
+        pass # 子进程已经退出
+
+async def run_command(args):
+    """
+    运行一个外部命令并等待其完成；返回码非零时抛出 CalledProcessError。
+    stdout 被丢弃；stderr 直接由内核写入匿名临时文件，运行期间不产生任何管道读取，
+    只有在命令失败时才读回，用于错误报告。
+    """
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        pin_worker(proc)
+        await proc.wait()
+        if proc.returncode:
+            stderr_file.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, args, stderr=stderr_file.read())
+
+
+# ... (run_uf_tasks 用于 UF 作业) ...
+async def run_uf_tasks(job_id, task_arrivals, job_start_time, sim_task_duration):
+    """
+    在一个协程中模拟一个UF作业的全部任务（例如Web请求）。
+    任务的到达和完成都是按时间排序的事件，由一个最小堆驱动，每次只等待最近的事件。
+    """
+    # 1. 所有任务的到达事件: (绝对时间, 任务编号, 任务开始时间)，到达事件的开始时间为 None
+    events = [(job_start_time + arrival, task_id, None)
+              for task_id, arrival in enumerate(task_arrivals.tolist())]
+    heapq.heapify(events)
     
-    if wait_time > 0:
-        time.sleep(wait_time)
+    while events:
+        deadline, task_id, task_start = heapq.heappop(events)
+        wait_time = deadline - time.monotonic()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
         
-    task_start = time.time()
-    # 模拟日志：任务到达
-    print(f"  {get_sim_time(WORKLOAD_START_TIME):.2f}s |   Job {job_id} (UF) -> Task {task_id} 到达。")
-    
-    # 2. 模拟任务执行
-    time.sleep(sim_task_duration)
-    
-    task_end = time.time()
-    print(f"  {get_sim_time(WORKLOAD_START_TIME):.2f}s |   Job {job_id} (UF) <- Task {task_id} 完成 (耗时 {task_end - task_start:.3f}s)。")
+        now = time.monotonic()
+        if task_start is None:
+            # 模拟日志：任务到达
+            log_event(FMT_UF_TASK_ARRIVE, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, task_id=task_id)
+            # 2. 模拟任务执行：sim_task_duration 之后产生该任务的完成事件
+            heapq.heappush(events, (now + sim_task_duration, task_id, now))
+        else:
+            log_event(FMT_UF_TASK_DONE, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, task_id=task_id,
+                      elapsed=now - task_start)
 
 
 # !!! 3. run_job 函数是修改的重点 !!!
-def run_job(job, task_arrivals, sim_uf_task_duration, sim_batch_task_duration):
+async def run_job(job_id, job_type, app_type, task_count, task_arrivals,
+                  sim_uf_task_duration, sim_batch_task_duration):
     """
-    在一个单独的线程中模拟或执行一个完整的作业。
+    以协程的方式模拟或执行一个完整的作业。
     """
-    job_id = job['job_id']
-    app_type = job['app_type']
-    job_type = job['job_type']
-    task_count = job['task_count']
-    job_start_time = time.time() 
+    job_start_time = time.monotonic() 
 
     if job_type == "UF":
         # UF 作业 (如 nginx, redis) 保持模拟不变
-        print(f"{bcolors.OKBLUE}{get_sim_time(WORKLOAD_START_TIME):.2f}s | [服务启动] Job {job_id} (类型: {job_type}, 应用: {app_type}) 启动，等待 {task_count} 个任务...{bcolors.ENDC}")
+        log_event(FMT_UF_START, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, job_type=job_type,
+                  app_type=app_type, task_count=task_count)
         
-        task_threads = []
-        for i, task_arrival in enumerate(task_arrivals):
-            t = threading.Thread(
-                target=run_uf_task,
-                args=(job_id, i, task_arrival, job_start_time, sim_uf_task_duration)
-            )
-            t.start()
-            task_threads.append(t)
+        # 所有任务由同一个协程按事件顺序模拟，不再为每个任务创建线程或协程
+        await run_uf_tasks(job_id, task_arrivals, job_start_time, sim_uf_task_duration)
             
-        for t in task_threads:
-            t.join()
-            
-        print(f"{bcolors.OKBLUE}{get_sim_time(WORKLOAD_START_TIME):.2f}s | [服务完成] Job {job_id} (UF) 已完成所有 {task_count} 个任务。{bcolors.ENDC}")
+        log_event(FMT_UF_DONE, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, task_count=task_count)
         
     elif job_type == "B":
         # --- !!! 这是已修改的批处理作业逻辑 !!! ---
         
         # !!! 关键: 'task_count' 来自 wlGenerator.py，基于 J_D / T_D
-        # 我们用它来控制 Hadoop 作业的规模。
-        
-        # !!! 准备工作: 您必须修改以下路径 !!!
-        HADOOP_EXAMPLES_JAR = r"\\wsl.localhost\Ubuntu\home\mortis\hadoop-3.4.1\share\hadoop\mapreduce\hadoop-mapreduce-examples-3.4.1.jar"
+        # 我们用它来控制 Hadoop 作业的规模 (见 APP_CMD_TEMPLATES)。
+        args = build_hadoop_args(app_type, job_id, task_count)
         
-        command_to_run = None
-        
-        if app_type == "pi":
-            # 用 'task_count' 作为 Map 任务的数量
-            # 最后一个参数是每个 map 的样本数 (固定为 1000)
-            num_maps = task_count
-            samples_per_map = 1000
-            command_to_run = f"hadoop jar {HADOOP_EXAMPLES_JAR} pi {num_maps} {samples_per_map}"
-            
-        elif app_type == "wordcount":
-            # 'task_count' 无法直接控制 wordcount。
-            # 您必须提前在 HDFS 上准备好 /inputs/wordcount_data
-            input_dir = "/inputs/wordcount_data"
-            output_dir = f"/outputs/wordcount_{job_id}"
-            command_to_run = f"hadoop jar {HADOOP_EXAMPLES_JAR} wordcount {input_dir} {output_dir}"
-
-        elif app_type == "grep":
-            # 'task_count' 无法直接控制 grep。
-            # 您必须提前在 HDFS 上准备好 /inputs/grep_data
-            input_dir = "/inputs/grep_data"
-            output_dir = f"/outputs/grep_{job_id}"
-            regex = "'Tracie'" # 示例正则表达式
-            command_to_run = f"hadoop jar {HADOOP_EXAMPLES_JAR} grep {input_dir} {output_dir} {regex}"
-            
-        elif app_type == "terasort":
-            # Terasort 是 I/O 密集型基准测试
-            # 'task_count' 可以完美映射为 'teragen' (数据生成) 的记录数
-            # 注意：这会生成数据，然后排序。这是一个两步过程。
-            # 为简单起见，我们只运行 teragen（写密集型）
-            # 或者您可以运行 terasort（读/网络/写密集型）
-            
-            # --- 方案 A: 运行 Teragen (用 task_count 控制数据大小) ---
-            num_rows = task_count * 1000 # 假设 task_count 太小，我们将其放大
-            output_dir = f"/outputs/teragen_{job_id}"
-            command_to_run = f"hadoop jar {HADOOP_EXAMPLES_JAR} teragen {num_rows} {output_dir}"
-            
-            # --- 方案 B: 运行 Terasort (假设数据已在 /inputs/terasort_data) ---
-            # input_dir = "/inputs/terasort_data"
-            # output_dir = f"/outputs/terasort_{job_id}"
-            # command_to_run = f"hadoop jar {HADOOP_EXAMPLES_JAR} terasort {input_dir} {output_dir}"
-            
-        
-        if command_to_run:
+        if args:
             # --- 如果是 Hadoop 作业，则真实执行 ---
-            print(f"{bcolors.OKCYAN}{get_sim_time(WORKLOAD_START_TIME):.2f}s | [Hadoop] Job {job_id} (应用: {app_type}) 启动...{bcolors.ENDC}")
-            print(f"           L 执行命令: {command_to_run}")
+            log_event(FMT_HADOOP_START, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, app_type=app_type)
+            log_event(FMT_COMMAND, command=' '.join(args))
             
             try:
-                # 使用 shlex.split 安全地分割命令
-                args = shlex.split(command_to_run)
-                
-                # 使用 subprocess.run()，它会等待命令执行完成
-                # 这是正确的，因为这个线程就代表这个作业
-                subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                if HADOOP_DAEMON is not None:
+                    # 交给常驻客户端执行，省去每个作业的 JVM 启动开销
+                    await HADOOP_DAEMON.run(job_id, args)
+                else:
+                    # 使用异步子进程，等待命令完成期间不会阻塞事件循环
+                    await run_command(args)
                 
-                job_end_time = time.time()
-                print(f"{bcolors.OKGREEN}{get_sim_time(WORKLOAD_START_TIME):.2f}s | [Hadoop] Job {job_id} (应用: {app_type}) 完成 (耗时 {job_end_time - job_start_time:.2f}s)。{bcolors.ENDC}")
+                job_end_time = time.monotonic()
+                log_event(FMT_HADOOP_DONE, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, app_type=app_type,
+                          elapsed=job_end_time - job_start_time)
             
             except subprocess.CalledProcessError as e:
-                job_end_time = time.time()
-                print(f"{bcolors.FAIL}{get_sim_time(WORKLOAD_START_TIME):.2f}s | [Hadoop] Job {job_id} (应用: {app_type}) 失败 (耗时 {job_end_time - job_start_time:.2f}s)。{bcolors.ENDC}")
-                print(f"           L 错误: {e.stderr.decode('utf-8')}")
+                job_end_time = time.monotonic()
+                log(FMT_HADOOP_FAIL.format(t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, app_type=app_type,
+                                           elapsed=job_end_time - job_start_time))
+                log(FMT_ERROR_DETAIL.format(error=e.stderr.decode('utf-8', errors='replace')))
+            except RuntimeError as e:
+                log(FMT_HADOOP_ERROR.format(t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, app_type=app_type, error=e))
             except FileNotFoundError:
-                print(f"{bcolors.FAIL}错误：Hadoop 命令未找到。请检查您的 PATH 或 HADOOP_EXAMPLES_JAR 路径。{bcolors.ENDC}")
+                log(MSG_HADOOP_NOT_FOUND)
 
         else:
             # --- 如果是其他批处理作业 (如 rodinia_kmeans)，则回退到模拟 ---
-            print(f"{bcolors.OKCYAN}{get_sim_time(WORKLOAD_START_TIME):.2f}s | [模拟] Job {job_id} (类型: {job_type}, 应用: {app_type}) 启动，处理 {task_count} 个任务...{bcolors.ENDC}")
+            log_event(FMT_SIM_START, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id, job_type=job_type,
+                      app_type=app_type, task_count=task_count)
             
             total_duration = task_count * sim_batch_task_duration
-            time.sleep(total_duration)
+            await asyncio.sleep(total_duration)
             
-            job_end_time = time.time()
-            print(f"{bcolors.OKCYAN}{get_sim_time(WORKLOAD_START_TIME):.2f}s | [模拟] Job {job_id} (B) 完成 (总耗时 {job_end_time - job_start_time:.2f}s)。{bcolors.ENDC}")
+            job_end_time = time.monotonic()
+            log_event(FMT_SIM_DONE, t=get_sim_time(WORKLOAD_START_TIME), job_id=job_id,
+                      elapsed=job_end_time - job_start_time)
+
+async def run_job_bounded(semaphore, *job_args):
+    """
+    在并发上限内执行作业：超出上限的作业在信号量上排队，等待空闲名额。
+    单个作业的意外异常只终止该作业，不影响其他作业和整个工作负载。
+    """
+    async with semaphore:
+        try:
+            await run_job(*job_args)
+        except Exception as e:
+            log(FMT_JOB_ERROR.format(t=get_sim_time(WORKLOAD_START_TIME), job_id=job_args[0], error=e))
+
+async def start_hadoop_daemon(daemon_jar):
+    """
+    启动常驻 Hadoop 客户端；包装程序不可用时返回 None，回退到每个作业单独启动进程。
+    """
+    if not daemon_jar:
+        return None
+    if not os.path.exists(daemon_jar):
+        log(f"{bcolors.WARNING}警告: 常驻客户端包装程序未找到 '{daemon_jar}'，回退到逐个启动 Hadoop 进程。{bcolors.ENDC}")
+        return None
+    try:
+        return await HadoopDaemon.start(daemon_jar)
+    except FileNotFoundError:
+        log(f"{bcolors.WARNING}警告: Hadoop 命令未找到，回退到逐个启动 Hadoop 进程。{bcolors.ENDC}")
+        return None
+
+async def schedule(jobs, tasks_db, sim_uf_task_duration, sim_batch_task_duration, max_workers,
+                   hadoop_daemon_jar=None):
+    """
+    按到达时间依次调度所有作业，并等待它们全部完成。
+    同时执行的作业数不超过 max_workers。
+    """
+    global HADOOP_DAEMON
+    HADOOP_DAEMON = await start_hadoop_daemon(hadoop_daemon_jar)
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_workers)
+    running = set() # 已启动但尚未完成的作业，完成后立即移除
+    all_launched = loop.create_future()
+    app_types = jobs.app_types.tolist()
+    job_types = jobs.job_types.tolist()
+    job_count = len(jobs.job_ids)
+
+    def deadline(i):
+        # 第 i 个作业的绝对调度时间 (单调时钟)
+        # loop.time() 与 time.monotonic() 使用同一时钟，调度误差不会累积
+        return WORKLOAD_START_TIME + float(jobs.arrivals[i])
+
+    def launch(i):
+        # 3. 到达调度时间，启动第 i 个作业以及所有同样已到期的后续作业
+        #    (作为独立的协程，以防主调度循环阻塞)，然后只为下一个作业设置定时器。
+        #    作业表已按到达时间稳定排序，按下标依次启动即可保证同一时刻到达的作业保持文件顺序。
+        # 定时器回调中的异常不会传给 schedule，必须转交给 all_launched，否则调度会永远等待
+        try:
+            while True:
+                job_id = int(jobs.job_ids[i])
+                task = asyncio.create_task(run_job_bounded(
+                    semaphore, job_id, job_types[jobs.job_type_ids[i]], app_types[jobs.app_type_ids[i]],
+                    int(jobs.task_counts[i]), tasks_db[job_id],
+                    sim_uf_task_duration, sim_batch_task_duration))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                i += 1
+                if i == job_count:
+                    all_launched.set_result(None)
+                    return
+                if deadline(i) > loop.time():
+                    break
+            loop.call_at(deadline(i), launch, i)
+        except Exception as e:
+            if not all_launched.done():
+                all_launched.set_exception(e)
+
+    # 1~2. 由事件循环的定时器在调度时间到达时启动作业；任一时刻只有一个定时器在等待
+    if job_count:
+        loop.call_at(deadline(0), launch, 0)
+    else:
+        all_launched.set_result(None)
+    await all_launched
+        
+    # 4. 等待所有作业完成
+    log(f"\n{bcolors.HEADER}--- 所有作业已调度，等待执行完成... ---{bcolors.ENDC}")
+    await asyncio.gather(*running)
+
+    if HADOOP_DAEMON is not None:
+        await HADOOP_DAEMON.close()
+        HADOOP_DAEMON = None
 
 # ... (main 函数保持不变) ...
 def main():
-    global WORKLOAD_START_TIME
+    global WORKLOAD_START_TIME, QUIET
     
     parser = argparse.ArgumentParser(description="Tracie 工作负载执行器")
     parser.add_argument('--jobs-file', type=str, default='generated_jobs.csv',
                         help="输入的作业CSV文件")
-    parser.adds_argument('--tasks-file', type=str, default='generated_tasks.csv',
+    parser.add_argument('--tasks-file', type=str, default='generated_tasks.csv',
                         help="输入的任务CSV文件")
     parser.add_argument('--uf-task-time', type=float, default=0.05,
                         help="模拟UF任务（如请求）的持续时间（秒）")
     parser.add_argument('--batch-task-time', type=float, default=0.1,
                         help="模拟Batch任务的持续时间（秒）")
+    parser.add_argument('--max-workers', type=int, default=min(32, (os.cpu_count() or 1) * 8),
+                        help="同时执行的作业数上限，超出的作业排队等待")
+    parser.add_argument('--hadoop-daemon-jar', type=str, default=None,
+                        help="常驻 Hadoop 客户端包装程序的 jar 路径，所有 Hadoop 作业共用一个 JVM")
+    parser.add_argument('--no-wait', action='store_true',
+                        help="不等待回车，加载完成后立即开始执行")
+    parser.add_argument('--pin-cpus', action='store_true',
+                        help="把调度线程绑定到一个专用 CPU，Hadoop 子进程使用其余 CPU (仅 Linux)")
+    parser.add_argument('--quiet', action='store_true',
+                        help="不输出每个作业/任务的进度日志，只保留失败信息和汇总")
     
     args = parser.parse_args()
+    QUIET = args.quiet
+    if args.max_workers < 1:
+        parser.error("--max-workers 必须至少为 1")
 
-    print("正在加载工作负载文件...")
+    log("正在加载工作负载文件...")
+    flush_log() # 加载失败时错误信息直接写入 stderr，先写出之前的日志
     jobs, tasks_db = load_jobs_and_tasks(args.jobs_file, args.tasks_file)
-    print(f"加载了 {len(jobs)} 个作业。")
+    log(f"加载了 {len(jobs.job_ids)} 个作业。")
     
-    if not jobs:
-        print("没有可执行的作业。退出。")
+    if len(jobs.job_ids) == 0:
+        log("没有可执行的作业。退出。")
         return
 
-    print(f"\n{bcolors.BOLD}--- Tracie 工作负载执行器启动 ---{bcolors.ENDC}")
-    print(f"模拟配置: UF任务={args.uf_task_time}s, Batch任务={args.batch_task_time}s")
-    print("按回车键开始执行...")
-    try:
-        input()
-    except EOFError:
-        pass # 在非交互式环境中自动开始
+    log(f"\n{bcolors.BOLD}--- Tracie 工作负载执行器启动 ---{bcolors.ENDC}")
+    log(f"模拟配置: UF任务={args.uf_task_time}s, Batch任务={args.batch_task_time}s, 并发上限={args.max_workers}")
+    # 只有在交互式终端中才等待回车；stdin 为管道时直接开始，避免阻塞
+    if not args.no_wait and sys.stdin.isatty():
+        log("按回车键开始执行...")
+        flush_log()
+        try:
+            input()
+        except EOFError:
+            pass
+
+    if args.pin_cpus:
+        if pin_cpus():
+            log(f"调度线程已绑定到 CPU {sorted(os.sched_getaffinity(0))}，子进程使用 CPU {sorted(WORKER_CPUS)}")
+        else:
+            log(f"{bcolors.WARNING}警告: 当前平台不支持 CPU 绑定或可用 CPU 少于 2 个，忽略 --pin-cpus。{bcolors.ENDC}")
 
-    WORKLOAD_START_TIME = time.time()
-    job_threads = []
+    WORKLOAD_START_TIME = time.monotonic()
 
     try:
-        for job in jobs:
-            # 1. 计算作业应该在何时被调度
-            job_schedule_time = WORKLOAD_START_TIME + job['arrival_time_sec']
-            
-            # 2. 等待到达调度时间
-            current_time = time.time()
-            sleep_duration = job_schedule_time - current_time
-            
-            if sleep_duration > 0:
-                time.sleep(sleep_duration)
-                
-            # 3. 启动作业（在它自己的线程中，以防主调度循环阻塞）
-            job_thread = threading.Thread(
-                target=run_job,
-                args=(job, tasks_db[job['job_id']], args.uf_task_time, args.batch_task_time)
-            )
-            job_thread.start()
-            job_threads.append(job_thread)
-            
-        # 4. 等待所有作业线程完成
-        print(f"\n{bcolors.HEADER}--- 所有作业已调度，等待执行完成... ---{bcolors.ENDC}")
-        for t in job_threads:
-            t.join()
+        asyncio.run(schedule(jobs, tasks_db, args.uf_task_time, args.batch_task_time, args.max_workers,
+                             args.hadoop_daemon_jar))
             
-        print(f"\n{bcolors.BOLD}{bcolors.OKGREEN}--- 工作负载执行完毕 ---{bcolors.ENDC}")
-        print(f"总模拟时间: {get_sim_time(WORKLOAD_START_TIME):.2f} 秒")
+        log(f"\n{bcolors.BOLD}{bcolors.OKGREEN}--- 工作负载执行完毕 ---{bcolors.ENDC}")
+        log(f"总模拟时间: {get_sim_time(WORKLOAD_START_TIME):.2f} 秒")
         
     except KeyboardInterrupt:
-        print(f"\n{bcolors.FAIL}--- 用户中断！正在强制退出... ---{bcolors.ENDC}")
-        # 在真实的应用中，这里需要更优雅地处理线程关闭
+        log(f"\n{bcolors.FAIL}--- 用户中断！正在强制退出... ---{bcolors.ENDC}")
+        # asyncio.run 在中断时会取消所有未完成的作业协程
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -1,110 +1,172 @@
 import argparse
 import json
 import csv
-import random
+import functools
+import os
 import sys
+import numpy as np
 from scipy import stats
 
-def get_sampler(pdf_info):
+try:
+    from numba import njit
+except ImportError:
+    # 未安装 numba 时，核心函数以普通 Python 函数运行
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# 每批一起采样、计算的作业数
+GEN_BATCH_SIZE = 4096
+
+# 写入 CSV 时每批缓冲的作业行数，以及输出文件的缓冲区大小
+# (任务行的长度没有上限，不做行缓冲，直接写入文件缓冲区)
+WRITE_BATCH_ROWS = 10000
+WRITE_BUFFER_SIZE = 1 << 20
+
+# 单个作业任务数的上限 (与 wlExecutor 中 int32 的 task_count 列一致)
+MAX_TASKS_PER_JOB = np.iinfo(np.int32).max
+
+@functools.lru_cache(maxsize=64)
+def _get_distribution(pdf_type, params):
     """
-    根据配置文件中的PDF信息，返回一个随机采样函数。
+    返回用 params 初始化的 scipy.stats 分布 (frozen)，相同的 (类型, 参数) 只初始化一次。
     """
-    pdf_type = pdf_info["type"]
-    params = pdf_info["params"]
-    
     try:
         # 获取scipy.stats中的分布对象
         dist_obj = getattr(stats, pdf_type)
         # 使用参数初始化分布
-        dist = dist_obj(*params)
-        # 返回一个函数，该函数在被调用时返回一个随机样本
-        # .rvs(1)[0] 表示获取1个随机变量
-        return lambda: max(0, dist.rvs(1)[0])
+        return dist_obj(*params)
     except AttributeError:
         print(f"错误：不支持的PDF类型 '{pdf_type}'", file=sys.stderr)
         sys.exit(1)
     except Exception as e:
-        print(f"错误：初始化PDF '{pdf_type}' 失败，参数 {params}: {e}", file=sys.stderr)
+        print(f"错误：初始化PDF '{pdf_type}' 失败，参数 {list(params)}: {e}", file=sys.stderr)
         sys.exit(1)
 
-def load_profile(profile_path):
+def get_sampler(pdf_info, rng):
+    """
+    根据配置文件中的PDF信息，返回一个批量随机采样函数。
+    sampler(n) 返回 n 个非负样本组成的 ndarray，随机数来自 numpy Generator rng。
+    """
+    dist = _get_distribution(pdf_info["type"], tuple(pdf_info["params"]))
+    # 返回一个函数，该函数在被调用时一次性返回 n 个随机样本
+    # .rvs(size=n) 在 scipy 内部是向量化的；传入 Generator 以绕过旧的 RandomState
+    return lambda n=1: np.maximum(0, dist.rvs(size=n, random_state=rng))
+
+@functools.lru_cache(maxsize=8)
+def _read_profile(profile_path, mtime):
+    """
+    读取并解析JSON配置文件；以 (路径, 修改时间) 为键缓存，文件改动后自动重新读取。
+    """
+    with open(profile_path, 'r') as f:
+        return json.load(f)
+
+def load_profile(profile_path, rng):
     """
     加载JSON配置文件。
     """
     try:
-        with open(profile_path, 'r') as f:
-            profile = json.load(f)
-            # 为配置文件中的每个参数创建采样器
-            samplers = {}
-            for param, pdf_info in profile["parameters"].items():
-                samplers[param] = get_sampler(pdf_info)
-            profile["samplers"] = samplers
-            return profile
+        # 复制一份，避免把采样器写入缓存中的配置
+        profile = dict(_read_profile(profile_path, os.path.getmtime(profile_path)))
     except FileNotFoundError:
         print(f"错误：配置文件未找到 '{profile_path}'", file=sys.stderr)
         sys.exit(1)
+        
+    # 为配置文件中的每个参数创建采样器
+    samplers = {}
+    for param, pdf_info in profile["parameters"].items():
+        samplers[param] = get_sampler(pdf_info, rng)
+    profile["samplers"] = samplers
+    return profile
+
+@njit(cache=True)
+def _gen_core(j_d, t_d, j_at, t_total, w_sat_factor, j_sd_factor):
+    """
+    一批作业的数值计算核心 (伪代码1 的第 3、4 步)。
+    返回 (缩放后的到达时间数组, 缩放后的任务数数组, 更新后的 t_total)。
+    任务数超出 MAX_TASKS_PER_JOB (包括 inf) 的作业记为 -1，由调用方报错。
+    """
+    n = j_d.shape[0]
+    arrivals = np.empty(n, dtype=np.float64)
+    task_counts = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        # 确保任务持续时间 > 0，避免除零
+        T_D_sample = max(t_d[i], 1e-6)
+        
+        # 3. 计算任务数 (JN)
+        J_N_calculated = j_d[i] / T_D_sample
+        
+        # 4. 应用缩放因子 [cite: 194-198]
+        # 应用 -wSat 缩放到达时间 
+        t_total = t_total + j_at[i] * w_sat_factor
+        arrivals[i] = t_total
+        
+        # 应用 -jSD 缩放任务数 
+        # 先检查上限再转换为整数：numba 会把溢出的值静默转换为负数
+        J_N_scaled = J_N_calculated * j_sd_factor
+        if not J_N_scaled <= MAX_TASKS_PER_JOB:
+            task_counts[i] = -1
+        else:
+            task_counts[i] = int(max(1.0, J_N_scaled))
+    return arrivals, task_counts, t_total
 
-def generate_workload(profile, num_jobs, w_sat_factor, j_sd_factor):
+def generate_workload(profile, num_jobs, w_sat_factor, j_sd_factor, rng, batch_size=GEN_BATCH_SIZE):
     """
     工作负载生成器 (实现伪代码1 )。
     这是一个生成器函数，它会 'yield' (产生) 每个作业的信息。
+    作业按 batch_size 分批采样，数值计算由 _gen_core 完成。
     """
     print(f"开始生成 {num_jobs} 个作业...")
     
     # 从配置文件中获取采样器和参数
     samplers = profile["samplers"]
-    app_pool = profile["app_pool"]
+    app_pool = np.array(profile["app_pool"])
     P_B = profile["P_B"] # 批处理作业的概率 
     
     t_total = 0.0 # 伪代码中的 t_total 
     
-    for job_id in range(num_jobs):
-        # 1. 决定作业类型 (B 或 UF)
-        if random.random() < P_B:
-            job_type = "B"
-            J_D_sampler = samplers["J_D_B"]
-            T_D_sampler = samplers["T_D_B"]
-            J_AT_sampler = samplers["J_AT_B"]
-            T_AT_sampler = samplers["T_AT_B"]
-        else:
-            job_type = "UF"
-            J_D_sampler = samplers["J_D_UF"]
-            T_D_sampler = samplers["T_D_UF"]
-            J_AT_sampler = samplers["J_AT_UF"]
-            T_AT_sampler = samplers["T_AT_UF"]
-            
-        # 2. 从PDF中采样
-        J_D_sample = J_D_sampler() # 作业持续时间
-        T_D_sample = T_D_sampler()
-        J_AT_sample = J_AT_sampler() # 作业到达间隔
+    for batch_start in range(0, num_jobs, batch_size):
+        n = min(batch_size, num_jobs - batch_start)
         
-        # 确保任务持续时间 > 0，避免除零
-        T_D_sample = max(T_D_sample, 1e-6)
+        # 1. 决定作业类型 (B 或 UF)
+        is_batch = rng.random(n) < P_B
+        n_batch = int(is_batch.sum())
         
-        # 3. 计算任务数 (JN)
-        J_N_calculated = J_D_sample / T_D_sample
+        # 2. 按作业类型从PDF中批量采样
+        j_d = np.empty(n) # 作业持续时间
+        t_d = np.empty(n)
+        j_at = np.empty(n) # 作业到达间隔
+        for samples, param in ((j_d, "J_D"), (t_d, "T_D"), (j_at, "J_AT")):
+            samples[is_batch] = samplers[param + "_B"](n_batch)
+            samples[~is_batch] = samplers[param + "_UF"](n - n_batch)
         
-        # 4. 应用缩放因子 [cite: 194-198]
-        # 应用 -wSat 缩放到达时间 
-        scaled_arrival_time = t_total + (J_AT_sample * w_sat_factor)
-        t_total = scaled_arrival_time # 更新 t_total
+        # 3-4. 计算任务数并应用缩放因子
+        arrivals, task_counts, t_total = _gen_core(j_d, t_d, j_at, t_total, w_sat_factor, j_sd_factor)
+        overflow = np.flatnonzero(task_counts < 0)
+        if len(overflow):
+            i = overflow[0]
+            J_N_scaled = j_d[i] / max(t_d[i], 1e-6) * j_sd_factor
+            print(f"错误：作业 {batch_start + i} 的任务数 {J_N_scaled:.3g} 超出上限 {MAX_TASKS_PER_JOB} "
+                  f"(本批共 {len(overflow)} 个作业超限)，请减小 -jSD 或检查配置文件中的 J_D/T_D 分布",
+                  file=sys.stderr)
+            sys.exit(1)
         
-        # 应用 -jSD 缩放任务数 
-        J_N_scaled = int(max(1, J_N_calculated * j_sd_factor))
-        
-        # 5. 选择一个应用程序
-        app_type = random.choice(app_pool)
+        # 5. 为每个作业选择一个应用程序
+        app_types = app_pool[rng.integers(0, len(app_pool), size=n)]
         
-        # 6. 生成任务到达时间 [cite: 209]
-        task_arrivals = []
-        task_time_within_job = 0.0
-        for _ in range(J_N_scaled):
-            task_inter_arrival = T_AT_sampler()
-            task_time_within_job += task_inter_arrival
-            task_arrivals.append(round(task_time_within_job, 6))
+        for i, (job_is_batch, arrival, J_N_scaled, app_type) in enumerate(
+                zip(is_batch.tolist(), arrivals.tolist(), task_counts.tolist(), app_types.tolist())):
+            job_type = "B" if job_is_batch else "UF"
+            T_AT_sampler = samplers["T_AT_B"] if job_is_batch else samplers["T_AT_UF"]
             
-        # 7. 产生作业及其任务
-        yield (job_id, scaled_arrival_time, job_type, app_type, J_N_scaled, task_arrivals)
+            # 6. 生成任务到达时间 [cite: 209]
+            # 一次性采样全部任务到达间隔，累加得到作业内的到达时间
+            task_inter_arrivals = T_AT_sampler(J_N_scaled)
+            task_arrivals = np.round(np.cumsum(task_inter_arrivals), 6)
+            
+            # 7. 产生作业及其任务 (task_arrivals 为 ndarray)
+            yield (batch_start + i, arrival, job_type, app_type, J_N_scaled, task_arrivals)
 
 def main():
     # 1. 设置命令行参数解析 [cite: 192, 195, 196, 198]
@@ -117,11 +179,15 @@ def main():
                         help="作业到达时间缩放因子 ")
     parser.add_argument('-jSD', '--j_sd', type=float, default=1.0, 
                         help="作业持续时间(任务数)缩放因子 ")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="随机数种子，用于复现同一个工作负载")
     
     args = parser.parse_args()
 
     # 2. 加载配置文件
-    profile = load_profile(args.profile)
+    # 所有 PDF 采样共用一个 PCG64 随机数生成器
+    rng = np.random.default_rng(args.seed)
+    profile = load_profile(args.profile, rng)
     print(f"已加载配置文件: {profile['name']}")
 
     # 3. 定义输出文件名 [cite: 209]
@@ -130,7 +196,8 @@ def main():
     
     # 4. 打开文件并写入
     try:
-        with open(jobs_file, 'w', newline='') as jf, open(tasks_file, 'w', newline='') as tf:
+        with open(jobs_file, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as jf, \
+             open(tasks_file, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as tf:
             job_writer = csv.writer(jf)
             task_writer = csv.writer(tf)
             
@@ -139,14 +206,21 @@ def main():
             task_writer.writerow(["job_id", "task_arrival_timestamps_within_job"])
             
             # 5. 循环生成器并写入文件 [cite: 205-209]
-            job_gen = generate_workload(profile, args.num_jobs, args.w_sat, args.j_sd)
+            job_gen = generate_workload(profile, args.num_jobs, args.w_sat, args.j_sd, rng)
+            jobs_buf = []
             
             for job_id, arrival, j_type, app, t_count, task_arrivals in job_gen:
-                # 写入作业文件
-                job_writer.writerow([job_id, round(arrival, 6), j_type, app, t_count])
+                # 作业行很短，先缓冲，每 WRITE_BATCH_ROWS 行批量写入一次
+                jobs_buf.append([job_id, round(arrival, 6), j_type, app, t_count])
+                if len(jobs_buf) >= WRITE_BATCH_ROWS:
+                    job_writer.writerows(jobs_buf)
+                    jobs_buf.clear()
                 
-                # 写入任务文件
-                task_writer.writerow([job_id] + task_arrivals)
+                # 任务行可能包含上千万个时间戳，逐行写出，避免在内存中堆积
+                task_writer.writerow([job_id, *task_arrivals.tolist()])
+            
+            # 写入剩余的作业行
+            job_writer.writerows(jobs_buf)
 
     except IOError as e:
         print(f"错误：写入文件失败: {e}", file=sys.stderr)